@@ -1,16 +1,21 @@
 #!/usr/bin/env python
 
-import copy
+import contextlib
+import hashlib
 import json
 import os
+import sqlite3
 import sys
+import time
 import traceback
 import ollama
-import requests
 import srt
 import re
 import ast
-from ollama import Client
+import asyncio
+import httpx
+from concurrent.futures import ProcessPoolExecutor
+from ollama import AsyncClient, Client
 
 # ----------------------------------------------------------------------
 # CONFIG CONSTANTS
@@ -18,6 +23,10 @@ from ollama import Client
 # Base URL for the Ollama server
 SERVER_URL = "http://server-dell.fritz.box:11434"
 
+# Maximum time in seconds to wait for the next part of a response from the Ollama server. None waits forever.
+# The server sends nothing while a request waits for a free slot, so only set this if requests never queue up on the server.
+SERVER_READ_TIMEOUT = None
+
 # Model to use for translations. Recommended: deepseek-r1:14b (slow, better quality), gemma2:9b-instruct-q4_K_M (fast, medium quality)
 MODEL_TRANSLATE = "gemma2:9b-instruct-q4_K_M"
 
@@ -31,6 +40,24 @@ TEMPERATURE_TRANSLATE = 0.0
 # Temperature setting for translation responses
 TEMPERATURE_TRANSLATE_FALLBACK = 0.6
 
+# Maximum number of tokens the model may generate per subtitle of a batch. Stops runaway generations early.
+# Set to -1 to disable the limit.
+MAX_TOKENS_PER_SUBTITLE_TRANSLATE = 128
+
+# Maximum number of tokens the fallback model may generate per subtitle of a batch.
+# Reasoning models like deepseek-r1 need a lot more for their thinking output, so the limit is disabled by default.
+MAX_TOKENS_PER_SUBTITLE_TRANSLATE_FALLBACK = -1
+
+# How long the server keeps the models loaded after the last request, e.g. "1h" or "30m".
+KEEP_ALIVE = "1h"
+
+# Context window size (in tokens) used for translation requests.
+# Must fit the prompt including all context subtitles and the response (and thinking output of reasoning models).
+CONTEXT_LENGTH_TRANSLATE = 8192
+
+# Number of prompt tokens the server processes at once. Higher values speed up prompt processing at the cost of VRAM.
+NUM_BATCH_TRANSLATE = 512
+
 # System prompt for initializing translation instructions.
 SYSTEM_PROMPT_TRANSLATE = ""
 
@@ -75,6 +102,19 @@ TRANSLATION_PREFIX = "<span style=\"color: yellow;\"><i>"
 # Suffix is optional
 TRANSLATION_SUFFIX = "</i></span>"
 
+# Subtitles (without HTML tags) that always get the same translation without asking the LLM, e.g. sound descriptions.
+# The defaults are German like PROMPT_TRANSLATE above; adjust them when changing the target language.
+FIXED_TRANSLATIONS: dict[str, str] = {
+  "[MUSIC]": "[MUSIK]",
+  "[MUSIC PLAYING]": "[MUSIK SPIELT]",
+  "[LAUGHTER]": "[GELÄCHTER]",
+  "[LAUGHS]": "[LACHT]",
+  "[APPLAUSE]": "[APPLAUS]",
+  "[SIGHS]": "[SEUFZT]",
+  "[GUNSHOT]": "[SCHUSS]",
+  "[SCREAMING]": "[SCHREIE]"
+}
+
 # How many previous and future subtitles will be given to the LLM:
 # SUBTITLE_CONTEXT_COUNT previous and SUBTITLE_CONTEXT_COUNT future subtitles will be given to it.
 SUBTITLE_CONTEXT_COUNT = 10
@@ -82,20 +122,71 @@ SUBTITLE_CONTEXT_COUNT = 10
 # How many subtitles will be given to the LLM at once.
 TRANSLATION_BATCH_LENGTH = 10
 
+# How many batches of subtitles will be sent to the server at the same time. Should match OLLAMA_NUM_PARALLEL of the server.
+# Batches that are translated at the same time can't see each other's translations as context,
+# so values above 1 are faster but may reduce the consistency of the translations.
+PARALLEL_TRANSLATION_BATCHES = 1
+
+# How many subtitle files will be processed at the same time, each in its own process.
+# Progress output of files processed at the same time will be mixed up.
+PARALLEL_FILES = 1
+
+# Reuse translations for subtitles with exactly the same text instead of asking the LLM again.
+# Cached translations are bound to MODEL_TRANSLATE, MODEL_TRANSLATE_FALLBACK and the prompts above; changing any of them invalidates the cache.
+CACHE_TRANSLATIONS = True
+
+# SQLite file in which cached translations are stored, so they can be reused in later runs (e.g. after a crash or for recurring lines).
+# Set to an empty string to only cache translations in memory during the current run.
+TRANSLATION_CACHE_FILE = os.path.join(os.path.dirname(__file__), "translation_cache.sqlite")
+
+# Force the LLM to respond with a JSON array of exactly as many translations as requested (structured outputs).
+# Prevents retries caused by malformed responses. Requires Ollama 0.5 or newer on the server.
+STRUCTURED_OUTPUT = True
+
 # Print debug output to console?
 DEBUG = False
 
 # END OF CONFIG CONSTANTS
 # ----------------------------------------------------------------------
 
+# Timeouts for requests to the Ollama server. The read timeout applies between two streamed response chunks.
+HTTP_TIMEOUT = httpx.Timeout(SERVER_READ_TIMEOUT, connect=10.0)
+
+# Keep idle connections to the Ollama server open, so they can be reused by the next request
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=40, max_connections=100, keepalive_expiry=30.0)
+
+# How often a failed connection attempt to the Ollama server is retried
+HTTP_RETRIES = 3
+
 # Client for interfacing with the Ollama server
-ollama_client = Client(host=SERVER_URL)
+ollama_client = Client(host=SERVER_URL, timeout=HTTP_TIMEOUT, transport=httpx.HTTPTransport(retries=HTTP_RETRIES, limits=HTTP_LIMITS))
+
+# Characters (and closing HTML tags) a line has to end with to count as the end of a sentence
+PUNCTUATION_MARKS = (".", "!", "?", "\"", "'", "♪", "]", ">", ")")
+
+# Matches HTML tags like "<i>" or "</font>"
+HTML_TAG_PATTERN = re.compile(r'<[^>]*>')
+
+# Matches the thinking output of reasoning models
+THINKING_PATTERN = re.compile(r'<think>.*</think>', re.DOTALL)
+
+# Matches texts without any words, e.g. only music notes, numbers or punctuation
+NO_WORDS_PATTERN = re.compile(r'[\W\d_]*')
+
+# Minimum time in seconds between two progress updates on the console
+PROGRESS_INTERVAL = 0.3
+
+# Time (time.monotonic()) of the last progress update on the console
+last_progress_time = 0.0
+
+# Cached translations of the current run and those loaded from TRANSLATION_CACHE_FILE, keyed by get_cache_key()
+translation_cache: dict[str, str] = {}
 
-# Holds the last up to SUBTITLE_CONTEXT_COUNT translations before the current subtitle
-prev_subs_and_translations: list[tuple[str, str]]
+# Set in worker processes (PARALLEL_FILES > 1) once Ctrl+C was pressed, so they don't start any of the files already queued for them
+worker_interrupted = False
 
-# Holds the next up to SUBTITLE_CONTEXT_COUNT translations in the future of the current subtitle
-future_subs: list[str]
+# Whether TRANSLATION_CACHE_FILE can be used. Disabled after the first error, so the translator continues with the in-memory cache only.
+translation_cache_file_usable = True
 
 
 def remove_html_tags(text: str) -> str:
@@ -108,7 +199,11 @@ def remove_html_tags(text: str) -> str:
   Returns:
     str: The text without HTML tags.
   """
-  return re.sub(r'<[^>]*>', '', text).strip()
+  # most subtitles don't contain any HTML, so skip the regex for them
+  if "<" not in text:
+    return text.strip()
+
+  return HTML_TAG_PATTERN.sub('', text).strip()
 
 def remove_thinking(text: str) -> str:
   """
@@ -120,7 +215,44 @@ def remove_thinking(text: str) -> str:
   Returns:
     str: The text without the thinking tags and content.
   """
-  return re.sub(r'<think>(.|\n)*</think>', '', text).strip()
+  return THINKING_PATTERN.sub('', text).strip()
+
+def extract_list(text: str) -> str:
+  """
+  Extract the list from a given text (LLM response), dropping anything around it like Markdown code fences or comments.
+
+  Args:
+    text (str): The text containing the list.
+
+  Returns:
+    str: The text from the first "[" to the last "]", or the unchanged text if there is no such part.
+  """
+  start = text.find("[")
+  end = text.rfind("]")
+
+  if start == -1 or end < start:
+    return text
+
+  return text[start:end + 1]
+
+def parse_list(text: str):
+  """
+  Parse a list from a given text (LLM response).
+
+  Args:
+    text (str): The text containing only the list.
+
+  Raises:
+    ValueError, SyntaxError: If the text is neither a JSON array nor a Python list literal.
+
+  Returns:
+    The parsed object, which has to be validated by the caller.
+  """
+  try:
+    return json.loads(text)
+  except json.JSONDecodeError:
+    # some models respond with a Python list, e.g. using single quotes
+    return ast.literal_eval(text)
 
 def ends_with_punctuation(text: str) -> bool:
   """
@@ -132,7 +264,7 @@ def ends_with_punctuation(text: str) -> bool:
   Returns:
     bool: True if the text ends with a punctuation mark or HTML tag, False otherwise.
   """
-  return text.endswith((".", "!", "?", "\"", "'", "♪", "]", ">", ")"))
+  return text.endswith(PUNCTUATION_MARKS)
 
 def starts_with_hyphen(text: str) -> bool:
     """
@@ -148,47 +280,83 @@ def starts_with_hyphen(text: str) -> bool:
     text = remove_html_tags(text)
     return text.startswith("-")
 
-def reset_context():
+def is_translatable(text: str) -> bool:
+  """
+  Check if the given text contains anything that needs to be translated.
+
+  Args:
+    text (str): The text to check, without HTML tags.
+
+  Returns:
+    bool: False if the text only consists of numbers, punctuation, symbols (like "♪") and whitespace, True otherwise.
   """
-  Resets the context by clearing global variables related to future
-  subtitles and previous subtitles along with translations.
+  return not NO_WORDS_PATTERN.fullmatch(text)
+
+def print_progress(action: str, progress: float, force: bool = False):
+  """
+  Print the progress of an action on the current console line, at most once every PROGRESS_INTERVAL seconds.
+
+  Args:
+    action (str): The name of the action, e.g. "Translating".
+    progress (float): The progress in percent.
+    force (bool): Print the progress even if the last update was less than PROGRESS_INTERVAL seconds ago.
+  """
+  global last_progress_time
+
+  now = time.monotonic()
+  if not force and now - last_progress_time < PROGRESS_INTERVAL:
+    return
+
+  last_progress_time = now
+  sys.stdout.write(f"\r{action}... {progress:.2f}% complete")
+  sys.stdout.flush()
+
+def escape_prompt_text(text: str) -> str:
   """
-  global future_subs, prev_subs_and_translations
+  Escape new lines and double quotes, so the text can be put into a single line of the prompt.
 
-  future_subs = []
-  prev_subs_and_translations = []
+  Args:
+    text (str): The text to escape.
+
+  Returns:
+    str: The escaped text.
+  """
+  return text.replace("\n", "\\n").replace("\"", "\\\"")
 
-def update_future_subs(index: int, subs: list[srt.Subtitle]):
+def get_future_subs(index: int, subs: list[srt.Subtitle]) -> list[str]:
   """
-  Updates the list of future subtitles (always excluding the current one) based on the given index.
+  Get the list of future subtitles (always excluding the current one) based on the given index.
 
   Args:
     index (int): The current index in the subtitle list.
     subs (list[srt.Subtitle]): The list of subtitle objects.
-  """
-  global future_subs
 
-  future_subs = []
+  Returns:
+    list[str]: The next up to SUBTITLE_CONTEXT_COUNT subtitles.
+  """
+  future_subs: list[str] = []
   # slice from excluding current subtitle to the next SUBTITLE_CONTEXT_COUNT subtitles. list will always be <=SUBTITLE_CONTEXT_COUNT
   for sub in [sub.content for sub in subs[index:]]:
     future_subs.append(sub.strip())
 
     # never go above SUBTITLE_CONTEXT_COUNT
     if len(future_subs) >= SUBTITLE_CONTEXT_COUNT:
-      return
-    
+      break
 
-def update_previous_subs_and_translations(index: int, subs: list[srt.Subtitle]):
+  return future_subs
+
+def get_previous_subs_and_translations(index: int, subs: list[srt.Subtitle]) -> list[tuple[str, str]]:
   """
-  Updates the list of previous subtitles and translations based on the given index.
+  Get the list of previous subtitles and translations based on the given index.
 
   Args:
       index (int): The current index in the subtitle list.
       subs (list[srt.Subtitle]): The list of subtitle objects.
-  """
-  global prev_subs_and_translations
 
-  prev_subs_and_translations = []
+  Returns:
+      list[tuple[str, str]]: The last up to SUBTITLE_CONTEXT_COUNT subtitles before the index that are already translated, along with their translations.
+  """
+  prev_subs_and_translations: list[tuple[str, str]] = []
 
   start_index = max(0, index - SUBTITLE_CONTEXT_COUNT)
   for sub in subs[start_index:index]:
@@ -208,6 +376,8 @@ def update_previous_subs_and_translations(index: int, subs: list[srt.Subtitle]):
     if len(prev_subs_and_translations) >= SUBTITLE_CONTEXT_COUNT:
       break
 
+  return prev_subs_and_translations
+
 def is_valid_list(obj) -> bool:
   """
   Check if an object is a list of strings or a list of lists of strings.
@@ -232,17 +402,135 @@ def is_valid_list(obj) -> bool:
   
   return True
 
+def get_model_options(temp: float | None = None, num_predict: int | None = None) -> ollama.Options:
+  """
+  Build the options for a request to the translation models.
+
+  The context length and batch size are always set, because the server reloads the model
+  whenever they differ from the ones it was loaded with.
+
+  Args:
+    temp (float | None): The temperature setting for the generation process, or None for the default.
+    num_predict (int | None): The maximum number of tokens to generate (-1 for no limit), or None for the default.
+
+  Returns:
+    ollama.Options: The options for the request.
+  """
+  return ollama.Options(
+    temperature=temp,
+    num_predict=num_predict,
+    num_ctx=CONTEXT_LENGTH_TRANSLATE,
+    num_batch=NUM_BATCH_TRANSLATE
+  )
+
+def get_response_format(required_response_length: int) -> dict | None:
+  """
+  Build the JSON schema the LLM response has to follow.
+
+  Args:
+    required_response_length (int): The expected number of translations.
+
+  Returns:
+    dict | None: A JSON schema of an array with exactly the required number of translations,
+                 or None if STRUCTURED_OUTPUT is disabled.
+  """
+  if not STRUCTURED_OUTPUT:
+    return None
+
+  return {
+    "type": "array",
+    "items": {
+      "anyOf": [
+        {"type": "string"},
+        {"type": "array", "items": {"type": "string"}}
+      ]
+    },
+    "minItems": required_response_length,
+    "maxItems": required_response_length
+  }
+
+def get_cache_key(text: str) -> str:
+  """
+  Build the translation cache key for a subtitle text.
+
+  Args:
+    text (str): The subtitle text without HTML tags.
+
+  Returns:
+    str: A hash of the text, the translation models and the translation prompts.
+  """
+  key = hashlib.blake2b(digest_size=16)
+  for part in (MODEL_TRANSLATE, MODEL_TRANSLATE_FALLBACK, SYSTEM_PROMPT_TRANSLATE, PROMPT_TRANSLATE, text):
+    key.update(part.encode())
+    key.update(b"\0")
+
+  return key.hexdigest()
+
+def load_translation_cache():
+  """
+  Load all cached translations from TRANSLATION_CACHE_FILE into memory.
+  If the file can't be used, a warning is printed and only the in-memory cache is used.
+  """
+  global translation_cache_file_usable
+
+  if not CACHE_TRANSLATIONS or not TRANSLATION_CACHE_FILE:
+    return
+
+  try:
+    with contextlib.closing(sqlite3.connect(TRANSLATION_CACHE_FILE)) as connection:
+      with connection:
+        connection.execute("CREATE TABLE IF NOT EXISTS tm(hash TEXT PRIMARY KEY, src TEXT, tgt TEXT, model TEXT, ts INTEGER)")
+
+      translation_cache.update(connection.execute("SELECT hash, tgt FROM tm"))
+  except sqlite3.Error as e:
+    translation_cache_file_usable = False
+    print(f"Warning: Cannot load translation cache {TRANSLATION_CACHE_FILE}, continuing without it: {e}")
+
+def save_translation_cache(entries: list[tuple[str, str, str]], model: str):
+  """
+  Add new translations to the cache and write them to TRANSLATION_CACHE_FILE in a single transaction.
+  If the file can't be written, a warning is printed and only the in-memory cache is used from then on.
 
-def prompt_model(prompt:str, required_response_length:int, model:str, temp:float):
+  Args:
+    entries (list[tuple[str, str, str]]): Tuples of cache key, subtitle text and translation.
+    model (str): The model that produced the translations.
+  """
+  global translation_cache_file_usable
+
+  if not CACHE_TRANSLATIONS:
+    return
+
+  for key, _, translation in entries:
+    translation_cache[key] = translation
+
+  if not TRANSLATION_CACHE_FILE or not translation_cache_file_usable:
+    return
+
+  timestamp = int(time.time())
+  try:
+    with contextlib.closing(sqlite3.connect(TRANSLATION_CACHE_FILE)) as connection:
+      with connection:
+        connection.executemany(
+          "INSERT OR REPLACE INTO tm(hash, src, tgt, model, ts) VALUES (?, ?, ?, ?, ?)",
+          [(key, text, translation, model, timestamp) for key, text, translation in entries]
+        )
+  except sqlite3.Error as e:
+    translation_cache_file_usable = False
+    print(f"\nWarning: Cannot save translations to cache {TRANSLATION_CACHE_FILE}, continuing without it: {e}")
+
+
+async def prompt_model(client: AsyncClient, prompt:str, required_response_length:int, model:str, temp:float, max_tokens_per_sub:int):
   """
   Request a translation from the server using the Ollama client, ensuring
   that the response matches the required length.
 
   Args:
+    client (AsyncClient): The client used to send the request.
     prompt (str): The prompt or query to be sent to the server for translation.
     required_response_length (int): The expected number of translations to be returned.
     model (str): The model to be used for generating translations.
     temp (float): The temperature setting for the generation process.
+    max_tokens_per_sub (int): The maximum number of tokens to generate per subtitle, or -1 for no limit.
 
   Raises:
     Exception: If the number of translations in the response does not match the required length.
@@ -251,21 +539,21 @@ def prompt_model(prompt:str, required_response_length:int, model:str, temp:float
     list[str]: A list of translations received from the server.
   """
   # request translation from the server
-  stream = ollama_client.generate(
+  stream = await client.generate(
     model=model,
     prompt=prompt,
     system=SYSTEM_PROMPT_TRANSLATE,
+    format=get_response_format(required_response_length),
     stream=True,
-    options=ollama.Options(
-      temperature=temp
-    )
+    keep_alive=KEEP_ALIVE,
+    options=get_model_options(temp, max_tokens_per_sub * required_response_length if max_tokens_per_sub > 0 else -1)
   )
 
   if DEBUG:
     print("---------------- RESPONSE ----------------")
 
   resp_text = ""
-  for chunk in stream:
+  async for chunk in stream:
     resp_text += chunk['response']
     if DEBUG:
       print(chunk['response'], end='', flush=True)
@@ -273,7 +561,7 @@ def prompt_model(prompt:str, required_response_length:int, model:str, temp:float
   if DEBUG:
     print("\n-------------- END RESPONSE --------------")
 
-  resp_list = ast.literal_eval(remove_thinking(resp_text))
+  resp_list = parse_list(extract_list(remove_thinking(resp_text)))
 
   if len(resp_list) != required_response_length:
     raise Exception(f"LLM did not return correct amount of translations. Required: {required_response_length}. Got: {len(resp_list)}.")
@@ -283,52 +571,47 @@ def prompt_model(prompt:str, required_response_length:int, model:str, temp:float
 
   return resp_list
 
-def translate_batch(subs_batch:list[srt.Subtitle]):
+async def translate_batch(client: AsyncClient, texts: list[str], prev_subs_and_translations: list[tuple[str, str]], future_subs: list[str]):
   """
-  Translate text from one language to another using the Ollama client.
+  Translate a batch of subtitles from one language to another using the Ollama client.
 
   Args:
-    text (str): The text to translate.
+    client (AsyncClient): The client used to send the requests.
+    texts (list[str]): The subtitle texts to translate, already without HTML tags.
+    prev_subs_and_translations (list[tuple[str, str]]): The previous subtitles and their translations as context.
+    future_subs (list[str]): The upcoming subtitles as context.
 
   Returns:
-    str: The translated text.
+    tuple[str, list[str]]: The model that produced the translations and the translations of the subtitles.
   """
-  global prev_subs_and_translations, future_subs
-
   # create a list in string format of numbered previous subs and translations
-  prev_subs_and_translations_text = ""
-  for sub, translation in prev_subs_and_translations:
-    prev_subs_and_translations_text += f"- '{remove_html_tags(sub).replace("\n", "\\n").replace("\"", "\\\"")}'\n  Translation: '{translation.replace("\n", "\\n").replace("\"", "\\\"")}'\n"
+  prev_subs_and_translations_text = "\n".join(
+    f"- '{escape_prompt_text(remove_html_tags(sub))}'\n  Translation: '{escape_prompt_text(translation)}'"
+    for sub, translation in prev_subs_and_translations
+  )
 
   if not prev_subs_and_translations:
     prev_subs_and_translations_text = "No previous subtitles available."
 
-  prev_subs_and_translations_text = prev_subs_and_translations_text.strip()
-
   # create a list in string format of numbered subs to translate
-  # subtitle id
-  id = 1
-  subs_text = ""
-  for sub in subs_batch:
-    subs_text += f"- Subtitle {id}: '{remove_html_tags(sub.content).replace("\n", "\\n").replace("\"", "\\\"")}'\n"
-    id += 1
-
-  subs_text = subs_text.strip()
+  subs_text = "\n".join(
+    f"- Subtitle {id}: '{escape_prompt_text(text)}'"
+    for id, text in enumerate(texts, start=1)
+  )
 
   # create a list in string format of numbered upcoming subs
-  future_subs_text = ""
-  for sub in future_subs:
-    future_subs_text += f"- '{remove_html_tags(sub).replace("\n", "\\n").replace("\"", "\\\"")}'\n"
+  future_subs_text = "\n".join(
+    f"- '{escape_prompt_text(remove_html_tags(sub))}'"
+    for sub in future_subs
+  )
 
   if not future_subs:
     future_subs_text = "No future subtitles available."
 
-  future_subs_text = future_subs_text.strip()
-
   prompt = (PROMPT_TRANSLATE.replace("%prev_subs_and_translations%", prev_subs_and_translations_text)
                             .replace("%subs%", subs_text)
                             .replace("%future_subs%", future_subs_text)
-                            .replace("%sub_count%", str(len(subs_batch))))
+                            .replace("%sub_count%", str(len(texts))))
 
   if DEBUG:
     print()
@@ -339,7 +622,7 @@ def translate_batch(subs_batch:list[srt.Subtitle]):
   # retry default model 5 times
   for j in range(5):
     try:
-      return prompt_model(prompt, len(subs_batch), MODEL_TRANSLATE, TEMPERATURE_TRANSLATE)
+      return MODEL_TRANSLATE, await prompt_model(client, prompt, len(texts), MODEL_TRANSLATE, TEMPERATURE_TRANSLATE, MAX_TOKENS_PER_SUBTITLE_TRANSLATE)
     except Exception as e:
       if DEBUG:
         print(f"\nError: An error occurred while translating with model '{MODEL_TRANSLATE}' (Attempt {j + 1}/5): {e}")
@@ -350,13 +633,24 @@ def translate_batch(subs_batch:list[srt.Subtitle]):
   # retry fallback model 5 times
   for j in range(5):
     try:
-      return prompt_model(prompt, len(subs_batch), MODEL_TRANSLATE_FALLBACK, TEMPERATURE_TRANSLATE_FALLBACK)
+      return MODEL_TRANSLATE_FALLBACK, await prompt_model(client, prompt, len(texts), MODEL_TRANSLATE_FALLBACK, TEMPERATURE_TRANSLATE_FALLBACK, MAX_TOKENS_PER_SUBTITLE_TRANSLATE_FALLBACK)
     except Exception as e:
       if DEBUG:
         print(f"\nError: An error occurred while translating with fallback model '{MODEL_TRANSLATE_FALLBACK}' (Attempt {j + 1}/5): {e}")
 
   raise Exception("An error happend while translating and the maximum retry amount was reached.")
 
+def write_srt_file(filepath: str, subs: list[srt.Subtitle]):
+  """
+  Overwrite a subtitle file with the given subtitles.
+
+  Args:
+    filepath (str): The path to the subtitle file.
+    subs (list[srt.Subtitle]): The subtitles to write, already sorted and numbered.
+  """
+  with open(filepath, 'w', encoding='utf-8') as new_file:
+    new_file.write(srt.compose(subs, reindex=False))
+
 def translateSRTFile(subs: list[srt.Subtitle], filepath: str) -> list[srt.Subtitle]:
   """
   Translate subtitle contents and add translated text with styling.
@@ -368,45 +662,93 @@ def translateSRTFile(subs: list[srt.Subtitle], filepath: str) -> list[srt.Subtit
   Returns:
     list[srt.Subtitle]: A list of subtitles with translated content added.
   """
+  asyncio.run(translate_subs(subs, filepath))
+
+  print("\rTranslating... 100.00% complete")
+
+  return subs
 
-  # reset context for next file processing
-  reset_context()
+async def translate_subs(subs: list[srt.Subtitle], filepath: str):
+  """
+  Translate all untranslated batches of subtitles, sending up to PARALLEL_TRANSLATION_BATCHES batches at the same time.
 
+  Args:
+    subs (list[srt.Subtitle]): A list of subtitles to be translated.
+    filepath (str): The path to the subtitle file.
+  """
   total_subs = len(subs)
-  for startIndex in range(0, len(subs), TRANSLATION_BATCH_LENGTH):
-    # skip already translated subs
-    if (TRANSLATION_PREFIX in subs[startIndex].content or TRANSLATION_SUFFIX in subs[startIndex].content):
-      continue
 
-    # calculate and print translation progress
-    progress = (startIndex) / total_subs * 100
-    print(f"\rTranslating... {progress:.2f}% complete", end='')
+  # skip already translated subs
+  start_indices = [startIndex for startIndex in range(0, total_subs, TRANSLATION_BATCH_LENGTH)
+                   if not (TRANSLATION_PREFIX in subs[startIndex].content or TRANSLATION_SUFFIX in subs[startIndex].content)]
+
+  async with AsyncClient(host=SERVER_URL, timeout=HTTP_TIMEOUT, transport=httpx.AsyncHTTPTransport(retries=HTTP_RETRIES, limits=HTTP_LIMITS)) as client:
+    for n in range(0, len(start_indices), PARALLEL_TRANSLATION_BATCHES):
+      parallel_start_indices = start_indices[n:n+PARALLEL_TRANSLATION_BATCHES]
 
-    subs_batch = subs[startIndex:startIndex+TRANSLATION_BATCH_LENGTH]
+      # calculate and print translation progress, every round takes long enough to not need throttling
+      print_progress("Translating", parallel_start_indices[0] / total_subs * 100, force=True)
+
+      results = await asyncio.gather(
+        *[translate_subs_batch(client, startIndex, subs) for startIndex in parallel_start_indices],
+        return_exceptions=True
+      )
 
-    update_previous_subs_and_translations(startIndex, subs)
+      # save the finished batches even if another batch failed
+      write_srt_file(filepath, subs)
 
-    update_future_subs(startIndex + TRANSLATION_BATCH_LENGTH, subs)
+      for result in results:
+        if isinstance(result, BaseException):
+          raise result
 
-    # translate subtitle batch
-    translations = translate_batch(subs_batch)
+async def translate_subs_batch(client: AsyncClient, startIndex: int, subs: list[srt.Subtitle]):
+  """
+  Translate one batch of subtitles and add the translated text with styling.
 
-    for sub, translated_content in zip(subs_batch, translations):
+  Args:
+    client (AsyncClient): The client used to send the requests.
+    startIndex (int): The index of the first subtitle of the batch.
+    subs (list[srt.Subtitle]): The list of all subtitles of the file.
+  """
+  subs_batch = subs[startIndex:startIndex+TRANSLATION_BATCH_LENGTH]
+
+  prev_subs_and_translations = get_previous_subs_and_translations(startIndex, subs)
+
+  future_subs = get_future_subs(startIndex + TRANSLATION_BATCH_LENGTH, subs)
+
+  # look up already known translations
+  texts = [remove_html_tags(sub.content) for sub in subs_batch]
+  cache_keys = [get_cache_key(text) for text in texts]
+  translations: list[str | None] = []
+  for text, cache_key in zip(texts, cache_keys):
+    if not is_translatable(text):
+      # keep lines without words (e.g. music notes or numbers) as they are instead of asking the LLM
+      translations.append(text)
+    elif text in FIXED_TRANSLATIONS:
+      translations.append(FIXED_TRANSLATIONS[text])
+    else:
+      translations.append(translation_cache.get(cache_key))
+  missing = [i for i, translation in enumerate(translations) if translation is None]
+
+  new_cache_entries: list[tuple[str, str, str]] = []
+  if missing:
+    # translate the remaining subtitles of the batch
+    model, missing_translations = await translate_batch(client, [texts[i] for i in missing], prev_subs_and_translations, future_subs)
+    for i, translated_content in zip(missing, missing_translations):
       if isinstance(translated_content, (list, tuple)):
         translated_content = "\n".join(translated_content)
       translated_content = translated_content.strip().replace("\\n", "\n").replace("\\\"", "\"")
 
-      translated_content = translated_content.strip()
-
-      # add translated subtitle content back into original subtitle file with styling
-      sub.content += f"\n{TRANSLATION_PREFIX}{translated_content}{TRANSLATION_SUFFIX}"
+      translations[i] = translated_content.strip()
+      new_cache_entries.append((cache_keys[i], texts[i], translations[i]))
 
-    with open(filepath, 'w') as new_file:
-        new_file.write(srt.compose(subs))
+  for sub, translated_content in zip(subs_batch, translations):
+    # add translated subtitle content back into original subtitle file with styling
+    sub.content += f"\n{TRANSLATION_PREFIX}{translated_content}{TRANSLATION_SUFFIX}"
 
-  print("\rTranslating... 100.00% complete")
-
-  return subs
+  # only cache the new translations once they are part of the subtitles
+  if new_cache_entries:
+    save_translation_cache(new_cache_entries, model)
 
 def reformatSRTFile(subs: list[srt.Subtitle]) -> list[srt.Subtitle]:
   """
@@ -423,97 +765,141 @@ def reformatSRTFile(subs: list[srt.Subtitle]) -> list[srt.Subtitle]:
   total_subs = len(subs)
 
   prev_line = ""
-  line_builder = ""
+  prev_line_ends_with_punctuation = False
+  line_parts: list[str] = []
   start_sub = subs[0]
   for index, sub in enumerate(subs):
     # calculate and print reformatting progress
-    progress = (index + 1) / total_subs * 100
-    print(f"\rReformatting... {progress:.2f}% complete", end='')
+    print_progress("Reformatting", (index + 1) / total_subs * 100)
 
     sub_lines = sub.content.split("\n")
 
     for line in sub_lines:
       # remove leading and trailing whitespace
       line = line.strip()
+      # only strip the HTML tags once per line
+      line_starts_with_hyphen = starts_with_hyphen(line)
 
       # condition for concatenating hyphenated lines and removing new lines otherwise
-      if (starts_with_hyphen(line) and prev_line and not ends_with_punctuation(prev_line)):
+      if (line_starts_with_hyphen and prev_line and not prev_line_ends_with_punctuation):
         line = line[1:].strip()
-        line_builder += " "
-      elif (starts_with_hyphen(line) or prev_line.endswith(">") or line.startswith("<")):
-        line_builder += "\n"
+        line_parts.append(" ")
+      elif (line_starts_with_hyphen or prev_line.endswith(">") or line.startswith("<")):
+        line_parts.append("\n")
       else:
-        line_builder += " "
+        line_parts.append(" ")
 
-      line_builder += line
+      line_parts.append(line)
       prev_line = line
+      prev_line_ends_with_punctuation = ends_with_punctuation(line)
 
     # condition to create new subtitle entry
-    if (ends_with_punctuation(prev_line)):
-      formatted_subs.append(srt.Subtitle(formatted_sub_id, start_sub.start, sub.end, line_builder.strip(), ""))
+    if (prev_line_ends_with_punctuation):
+      formatted_subs.append(srt.Subtitle(formatted_sub_id, start_sub.start, sub.end, "".join(line_parts).strip(), ""))
 
       formatted_sub_id += 1
-      line_builder = ""
+      line_parts.clear()
       prev_line = ""
+      prev_line_ends_with_punctuation = False
       # move to next subtitle segment
-      start_sub = subs[-1] if sub == subs[-1] else subs[subs.index(sub) + 1]
-  print()
+      start_sub = subs[index + 1] if index + 1 < total_subs else subs[-1]
+  print("\rReformatting... 100.00% complete")
 
   return formatted_subs
 
+def process_file(filepath: str, n: int, total_files: int):
+  """
+  Reformat and translate a single subtitle file.
+
+  Args:
+    filepath (str): The path to the subtitle file.
+    n (int): The index of the file in the list of all files.
+    total_files (int): The total number of files.
+  """
+  # print progress of current file processing
+  print(f"\nFile {os.path.basename(filepath)} ({n + 1}/{total_files}):")
+
+  subs: list[srt.Subtitle]
+  with open(filepath, 'r', encoding='utf-8') as file:
+    # parse subtitle file content
+    subs = list(srt.parse(file.read()))
+
+  # only reformat files without any translations, as parallel batches may have translated later subtitles before earlier ones
+  if all(not TRANSLATION_PREFIX in sub.content and not TRANSLATION_SUFFIX in sub.content for sub in subs):
+    # sort and number the subtitles once, so they don't need to be reindexed every time the file is written
+    subs = list(srt.sort_and_reindex(reformatSRTFile(subs)))
+
+    # overwrite original subtitle file with current subtitles
+    write_srt_file(filepath, subs)
+
+  # a failed batch can leave gaps anywhere in the file, so check every subtitle
+  if any(not TRANSLATION_PREFIX in sub.content and not TRANSLATION_SUFFIX in sub.content for sub in subs):
+    # process each reformatted subtitle for translation
+    subs = translateSRTFile(subs, filepath)
+  else:
+    print("File is already translated, skipping formatting and translation...")
+
+def process_file_in_worker(filepath: str, n: int, total_files: int):
+  """
+  Reformat and translate a single subtitle file in a worker process, unless the worker was already interrupted by Ctrl+C.
+
+  Args:
+    filepath (str): The path to the subtitle file.
+    n (int): The index of the file in the list of all files.
+    total_files (int): The total number of files.
+  """
+  global worker_interrupted
+
+  if worker_interrupted:
+    return
+
+  try:
+    process_file(filepath, n, total_files)
+  except KeyboardInterrupt:
+    worker_interrupted = True
+    raise
+
 def main():
   """
   Main function to perform translation on subtitle files.
   """
   try:
     # check server connection
-    resp = requests.get(f"{SERVER_URL}")
-    resp.raise_for_status()
+    ollama_client.list()
   except Exception as e:
     print(f"Error: Cannot connect to Ollama server: {e}")
     sys.exit(1)
 
-  # directory where subtitle files are stored
-  subs_dir = os.path.join(os.path.dirname(__file__), 'subs')
-
-  # remove files ending in .gitkeep
-  files = sorted([f for f in os.listdir(subs_dir) if not f.endswith('.gitkeep')])
-  total_files = len(files)
-
-  # loop through all files in 'subs' directory
-  for n, filename in enumerate(files):
-    filepath = os.path.join(subs_dir, filename)
-
-    # print progress of current file processing
-    print(f"\nFile {filename} ({n + 1}/{total_files}):")
-
-    # skip non-SRT files and warn user
-    if not filepath.endswith(".srt"):
-      print(f"Warning: File {filepath} is not an SRT file, skipping")
-      continue
-
-    subs: list[srt.Subtitle]
-    with open(filepath, 'r') as file:
-      # parse subtitle file content
-      subs = list(srt.parse(''.join(file.readlines())))
+  try:
+    # load the translation model now, so the first translation doesn't have to wait for it
+    ollama_client.generate(model=MODEL_TRANSLATE, keep_alive=KEEP_ALIVE, options=get_model_options())
+  except Exception as e:
+    print(f"Error: Cannot load model {MODEL_TRANSLATE}: {e}")
+    sys.exit(1)
 
-    # check if subtitle file is already translated
-    if (not TRANSLATION_PREFIX in subs[0].content and not TRANSLATION_SUFFIX in subs[0].content):
-      subs = reformatSRTFile(copy.deepcopy(subs))
+  load_translation_cache()
 
-      # overwrite original subtitle file with current subtitles
-      with open(filepath, 'w') as new_file:
-        new_file.write(srt.compose(subs))
+  # directory where subtitle files are stored
+  subs_dir = os.path.join(os.path.dirname(__file__), 'subs')
 
-    if (not TRANSLATION_PREFIX in subs[-1].content and not TRANSLATION_SUFFIX in subs[-1].content):
-      # process each reformatted subtitle for translation
-      subs = translateSRTFile(copy.deepcopy(subs), filepath)
-    else:
-      print("File is already translated, skipping formatting and translation...")
-    
-    # overwrite original subtitle file with current subtitles
-    with open(filepath, 'w') as new_file:
-      new_file.write(srt.compose(subs))
+  # only process SRT files, skipping e.g. .gitkeep, downloaded zips and directories
+  with os.scandir(subs_dir) as entries:
+    filepaths = sorted(entry.path for entry in entries if entry.is_file() and entry.name.endswith('.srt'))
+  total_files = len(filepaths)
+
+  if PARALLEL_FILES > 1:
+    # worker processes need their own copy of the translation cache
+    with ProcessPoolExecutor(max_workers=PARALLEL_FILES, initializer=load_translation_cache) as executor:
+      try:
+        list(executor.map(process_file_in_worker, filepaths, range(total_files), [total_files] * total_files))
+      except KeyboardInterrupt:
+        # stop like the sequential loop does instead of processing the remaining files first
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+  else:
+    # loop through all files in 'subs' directory
+    for n, filepath in enumerate(filepaths):
+      process_file(filepath, n, total_files)
 
 
 